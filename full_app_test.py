@@ -1,57 +1,364 @@
+import argparse
 import subprocess
 import sys
 import time
 import os
-import urllib.request
+import http.client
+import urllib.parse
 import socket
 import json
+import asyncio
+import collections
+import hashlib
+import queue
 import re
+import contextlib
+import functools
+import selectors
+import shlex
+import shutil
+import signal
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import orjson  # Optional: faster JSON parsing when installed
+except ImportError:
+    orjson = None
+
+# Phases run concurrently, so each one logs into a thread-local buffer that is
+# written out as a single block when the phase finishes
+_log_lock = threading.Lock()
+_log_buffer = threading.local()
+
+def log(*args, sep=" ", end="\n"):
+    text = sep.join(str(arg) for arg in args) + end
+    lines = getattr(_log_buffer, "lines", None)
+    if lines is not None:
+        lines.append(text)
+        return
+    with _log_lock:
+        sys.stdout.write(text)
+        sys.stdout.flush()
+
+@contextlib.contextmanager
+def buffered_log():
+    """Hold back everything the current thread logs and emit it in one piece on exit."""
+    _log_buffer.lines = []
+    try:
+        yield
+    finally:
+        lines, _log_buffer.lines = _log_buffer.lines, None
+        with _log_lock:
+            sys.stdout.write("".join(lines))
+            sys.stdout.flush()
 
 # Utility functions for logging and timing
 def print_header(msg):
-    print(f"\n{'='*60}")
-    print(f" {msg}")
-    print(f"{'='*60}")
+    log(f"\n{'='*60}")
+    log(f" {msg}")
+    log(f"{'='*60}")
 
 def print_sub_header(msg):
-    print(f"\n--- {msg} ---")
+    log(f"\n--- {msg} ---")
+
+# (step name, seconds) for every timed step, reported at the end of main()
+_TIMINGS = []
+# Per-thread bookkeeping for the step being timed: seconds spent waiting on
+# another step's shared work, and an optional note for the timings table
+_step_state = threading.local()
 
 def time_step(func):
-    """Decorator to time a step and print duration."""
+    """Decorator to time a step and record its duration in _TIMINGS, excluding time spent waiting on shared work."""
+    @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        start = time.time()
-        result = func(*args, **kwargs)
-        duration = time.time() - start
-        print(f"⏱ {func.__name__} completed in {duration:.2f}s")
-        return result
+        _step_state.waited = 0.0
+        _step_state.note = None
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            duration = time.perf_counter() - start - _step_state.waited
+            name = f"{func.__name__} ({_step_state.note})" if _step_state.note else func.__name__
+            _TIMINGS.append((name, duration))
     return wrapper
 
-def run_command(command, cwd=None, shell=True, capture_output=True, ignore_error=False):
-    print(f"Running: {command}")
+def print_timings(limit=10):
+    print_sub_header(f"Slowest steps (top {limit}; concurrent phases overlap, so these don't sum to wall time)")
+    for name, duration in sorted(_TIMINGS, key=lambda t: -t[1])[:limit]:
+        log(f"⏱ {name.ljust(30)} {duration:8.2f}s")
+
+def write_timings_json(path):
+    """Dump step timings with the current commit so CI can trend them across runs."""
     try:
-        result = subprocess.run(
-            command,
-            cwd=cwd,
-            shell=shell,
-            check=not ignore_error,
-            stdout=subprocess.PIPE if capture_output else None,
-            stderr=subprocess.PIPE if capture_output else None,
-            text=True
-        )
+        git_sha = subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).strip().decode()
+    except (OSError, subprocess.CalledProcessError):
+        git_sha = None
+    with open(path, "w") as f:
+        json.dump({"phases": _TIMINGS, "ts": time.time(), "git_sha": git_sha}, f, indent=2)
+    log(f"📝 Timings written to {path}")
+
+async def _drain(stream, ring):
+    """Read a pipe in 64 KiB chunks, keeping only the lines that fit in ring."""
+    partial = b""
+    while chunk := await stream.read(65536):
+        lines = (partial + chunk).split(b"\n")
+        partial = lines.pop()
+        ring.extend(line + b"\n" for line in lines)
+    if partial:
+        ring.append(partial)
+
+async def _run_streaming(command, cwd, shell, capture_output, max_lines):
+    pipe = asyncio.subprocess.PIPE if capture_output else None
+    if shell:
+        proc = await asyncio.create_subprocess_shell(command, cwd=cwd, stdout=pipe, stderr=pipe)
+    else:
+        proc = await asyncio.create_subprocess_exec(*shlex.split(command), cwd=cwd, stdout=pipe, stderr=pipe)
+    ring_out = collections.deque(maxlen=max_lines)
+    ring_err = collections.deque(maxlen=max_lines)
+    if capture_output:
+        # Drain both pipes concurrently so neither can fill up and block the child
+        await asyncio.gather(_drain(proc.stdout, ring_out), _drain(proc.stderr, ring_err))
+    returncode = await proc.wait()
+    decode = lambda ring: b"".join(ring).decode("utf-8", "replace")
+    return returncode, decode(ring_out), decode(ring_err)
+
+def run_command(command, cwd=None, shell=True, capture_output=True, ignore_error=False, max_lines=200):
+    """Run a command, keeping at most the last max_lines of each stream (None = keep everything)."""
+    log(f"Running: {command}")
+    returncode, stdout, stderr = asyncio.run(_run_streaming(command, cwd, shell, capture_output, max_lines))
+    if returncode == 0:
+        return True, stdout, stderr
+    if not ignore_error:
+        log("❌ Failed")
         if capture_output:
-            return True, result.stdout, result.stderr
-        return True, "", ""
-    except subprocess.CalledProcessError as e:
-        if not ignore_error:
-            print("❌ Failed")
-            if capture_output:
-                print(f"Error: {e.stderr}")
-        return False, e.stdout if capture_output else "", e.stderr if capture_output else ""
+            log(f"Error: {stderr}")
+    return False, stdout, stderr
+
+# Matches the lines of Jest's text-summary coverage reporter
+COVERAGE_SUMMARY_RE = re.compile(r"^(Statements|Branches|Functions|Lines)\s*:\s*(.+)$", re.MULTILINE)
+
+def resolve_tsc():
+    """Locate the tsc binary once so type checks skip the npx resolution step."""
+    local_tsc = os.path.join("node_modules", ".bin", "tsc.cmd" if os.name == "nt" else "tsc")
+    if os.path.exists(local_tsc):
+        return os.path.abspath(local_tsc)
+    return shutil.which("tsc")
+
+TSC_BIN = resolve_tsc()
+# --incremental reuses the type graph from the previous run via the build info file
+TSC_COMMAND = (f'"{TSC_BIN}"' if TSC_BIN else "npx tsc") + " --noEmit --incremental --tsBuildInfoFile .tsbuildinfo.cache"
+
+_tsc_lock = threading.Lock()
+_tsc_result = None
+
+def run_tsc():
+    """Run the TypeScript compiler at most once per process and share the result."""
+    global _tsc_result
+    wait_start = time.perf_counter()
+    with _tsc_lock:
+        if _tsc_result is None:
+            # Keep the full output so every "error TS" line is counted
+            _tsc_result = run_command(TSC_COMMAND, ignore_error=True, max_lines=None)
+        else:
+            # Another step paid for the compile; don't bill this one for waiting on it
+            _step_state.waited = getattr(_step_state, "waited", 0.0) + time.perf_counter() - wait_start
+            _step_state.note = "reused tsc"
+        return _tsc_result
+
+def is_plain_tsc(script):
+    """True if an npm script is just `tsc --noEmit`, i.e. equivalent to TSC_COMMAND."""
+    tokens = script.split()
+    if tokens[:1] == ["npx"]:
+        tokens = tokens[1:]
+    return tokens == ["tsc", "--noEmit"]
+
+# Parsed files keyed by (path, parser) -> ((mtime_ns, size), result)
+_stamp_cache = {}
+
+def cached_by_stamp(path, parse):
+    """Return parse(file bytes), reusing the previous result while the file's mtime and size are unchanged."""
+    st = os.stat(path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    key = (path, parse)
+    cached = _stamp_cache.get(key)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    with open(path, "rb") as f:
+        result = parse(f.read())
+    _stamp_cache[key] = (stamp, result)
+    return result
+
+def parse_json(data):
+    return orjson.loads(data) if orjson else json.loads(data)
+
+def load_json_cached(path):
+    return cached_by_stamp(path, parse_json)
+
+def list_dir_entries(directory):
+    """Return the entry names of a directory from a single scandir, or an empty set if it is missing."""
+    try:
+        with os.scandir(directory or ".") as it:
+            return {entry.name for entry in it}
+    except (FileNotFoundError, NotADirectoryError):
+        return set()
+
+class KeepAliveConnection(http.client.HTTPConnection):
+    """HTTPConnection that connects with a short timeout and reads with a longer one."""
+    def __init__(self, host, port, connect_timeout, read_timeout):
+        super().__init__(host, port, timeout=connect_timeout)
+        self.read_timeout = read_timeout
+
+    def connect(self):
+        # http.client reconnects on its own after `Connection: close`, so apply this on every connect
+        super().connect()
+        self.sock.settimeout(self.read_timeout)
+
+# Kept-alive HTTP connections keyed by (host, port), shared by the health checks
+_http_connections = {}
+_http_lock = threading.Lock()
+
+REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+
+def http_get(url, connect_timeout=1, read_timeout=5):
+    """GET url over a reused keep-alive connection, following one redirect hop like urlopen; returns (status, body)."""
+    status, location, body = _http_get_once(url, connect_timeout, read_timeout)
+    if status in REDIRECT_STATUSES and location:
+        target = urllib.parse.urljoin(url, location)
+        if urllib.parse.urlsplit(target).scheme == "http":
+            status, _, body = _http_get_once(target, connect_timeout, read_timeout)
+    return status, body
+
+def _http_get_once(url, connect_timeout, read_timeout):
+    parts = urllib.parse.urlsplit(url)
+    key = (parts.hostname, parts.port or 80)
+    path = parts.path or "/"
+    if parts.query:
+        path += f"?{parts.query}"
+    with _http_lock:
+        for attempt in range(2):
+            conn = _http_connections.get(key)
+            if conn is None:
+                conn = KeepAliveConnection(*key, connect_timeout, read_timeout)
+                conn.connect()
+                _http_connections[key] = conn
+            try:
+                conn.request("GET", path)
+                resp = conn.getresponse()
+                return resp.status, resp.getheader("Location"), resp.read()
+            except (http.client.HTTPException, ConnectionError):
+                # Server closed the idle connection; reconnect once before giving up
+                conn.close()
+                del _http_connections[key]
+                if attempt:
+                    raise
+            except OSError:
+                # Timed out mid-response; the connection is half-read and can't be reused
+                conn.close()
+                del _http_connections[key]
+                raise
+
+def close_http_connections():
+    with _http_lock:
+        for conn in _http_connections.values():
+            conn.close()
+        _http_connections.clear()
+
+@contextlib.contextmanager
+def spawn_server(cmd, **popen_kwargs):
+    """Start a long-running server in its own process group and tear the whole tree down on exit."""
+    args = [shutil.which(cmd[0]) or cmd[0], *cmd[1:]]
+    if os.name == "nt":
+        popen_kwargs["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        popen_kwargs["start_new_session"] = True
+    process = subprocess.Popen(args, cwd=os.getcwd(), **popen_kwargs)
+    try:
+        yield process
+    finally:
+        stop_process_tree(process)
+
+def stop_process_tree(process, timeout=5):
+    """Terminate a process started by spawn_server, escalating to kill after timeout."""
+    try:
+        if os.name == "nt":
+            if process.poll() is None:
+                process.send_signal(signal.CTRL_BREAK_EVENT)
+        else:
+            # start_new_session makes the server its own group leader, so pgid == pid
+            os.killpg(process.pid, signal.SIGTERM)
+    except (ProcessLookupError, PermissionError):
+        pass
+    try:
+        process.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        if os.name == "nt":
+            # npm is npm.cmd, so cmd.exe sits at a "Terminate batch job" prompt after the break;
+            # Popen.kill() would only end cmd.exe and orphan node, so take down the whole tree
+            subprocess.call(['taskkill', '/F', '/T', '/PID', str(process.pid)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        else:
+            with contextlib.suppress(ProcessLookupError, PermissionError):
+                os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+
+def iter_output_chunks(stream, deadline):
+    """Yield raw output chunks from a child's pipe as soon as they arrive, until EOF or deadline."""
+    if os.name != "nt":
+        fd = stream.fileno()
+        os.set_blocking(fd, False)
+        with selectors.DefaultSelector() as sel:
+            sel.register(fd, selectors.EVENT_READ)
+            while (remaining := deadline - time.monotonic()) > 0:
+                if not sel.select(timeout=remaining):
+                    continue
+                try:
+                    chunk = os.read(fd, 65536)
+                except BlockingIOError:
+                    continue
+                if not chunk:
+                    return
+                yield chunk
+    else:
+        # Windows pipes can't be registered with select, so pump them from a thread
+        chunks = queue.Queue()
+        def pump():
+            for chunk in iter(lambda: stream.read1(65536), b""):
+                chunks.put(chunk)
+            chunks.put(b"")
+        threading.Thread(target=pump, daemon=True).start()
+        while (remaining := deadline - time.monotonic()) > 0:
+            try:
+                chunk = chunks.get(timeout=remaining)
+            except queue.Empty:
+                return
+            if not chunk:
+                return
+            yield chunk
 
 def check_port(port):
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        # Short timeout so a filtered port doesn't stall on the OS connect timeout
+        s.settimeout(0.05)
         return s.connect_ex(('localhost', port)) == 0
 
+def wait_for_port(port, timeout):
+    """Poll until something listens on port, backing off from 10ms up to 500ms."""
+    start = time.monotonic()
+    deadline = start + timeout
+    next_report = start + 5
+    delay = 0.01
+    while time.monotonic() < deadline:
+        if check_port(port):
+            return True
+        now = time.monotonic()
+        if now >= next_report:
+            log(f"Waiting for server... ({int(now - start)}/{timeout}s)")
+            next_report += 5
+        time.sleep(min(delay, max(deadline - now, 0)))
+        delay = min(delay * 2, 0.5)
+    return False
+
 # ---------------------------------------------------------------------------
 # 1. File Structure Verification
 # ---------------------------------------------------------------------------
@@ -70,45 +377,52 @@ def check_file_structure():
         "src/types/game.ts"
     ]
     all_exist = True
+    dir_entries = {}
     for file_path in required_files:
-        if os.path.exists(file_path):
-            print(f"✅ Found: {file_path}")
+        parent, name = os.path.split(file_path)
+        if parent not in dir_entries:
+            dir_entries[parent] = list_dir_entries(parent)
+        if name in dir_entries[parent]:
+            log(f"✅ Found: {file_path}")
         else:
-            print(f"❌ Missing: {file_path}")
+            log(f"❌ Missing: {file_path}")
             all_exist = False
     return all_exist
 
 # ---------------------------------------------------------------------------
 # 2. Environment Variable Check
 # ---------------------------------------------------------------------------
+REQUIRED_ENV_KEYS = {
+    b"EXPO_PUBLIC_GEMINI_API_KEY",
+    b"EXPO_PUBLIC_FIREBASE_API_KEY",
+    b"EXPO_PUBLIC_FIREBASE_AUTH_DOMAIN",
+    b"EXPO_PUBLIC_FIREBASE_PROJECT_ID",
+}
+# KEY=value assignments; comment lines never match since they start with '#'
+ENV_KEY_RE = re.compile(rb"(?m)^\s*([A-Za-z_][A-Za-z0-9_]*)\s*=")
+
+def parse_env_keys(data):
+    return frozenset(ENV_KEY_RE.findall(data))
+
+def load_env_keys(path):
+    return cached_by_stamp(path, parse_env_keys)
+
 @time_step
 def check_environment_variables():
     print_header("2. Environment Variable Check")
     env_file = ".env.local"
     if not os.path.exists(env_file):
-        print(f"❌ {env_file} not found")
+        log(f"❌ {env_file} not found")
         return False
-    required_keys = [
-        "EXPO_PUBLIC_GEMINI_API_KEY",
-        "EXPO_PUBLIC_FIREBASE_API_KEY",
-        "EXPO_PUBLIC_FIREBASE_AUTH_DOMAIN",
-        "EXPO_PUBLIC_FIREBASE_PROJECT_ID"
-    ]
-    found_keys = []
     try:
-        with open(env_file, "r") as f:
-            for line in f:
-                if line.strip() and not line.startswith("#"):
-                    key = line.split("=")[0].strip()
-                    found_keys.append(key)
-        for key in required_keys:
-            if key in found_keys:
-                print(f"✅ Found key: {key}")
-            else:
-                print(f"⚠️ Missing key: {key}")
+        found_keys = load_env_keys(env_file)
+        if REQUIRED_ENV_KEYS.issubset(found_keys):
+            log(f"✅ All {len(REQUIRED_ENV_KEYS)} required keys found")
+        for key in sorted(REQUIRED_ENV_KEYS - found_keys):
+            log(f"⚠️ Missing key: {key.decode()}")
         return True
     except Exception as e:
-        print(f"❌ Error reading {env_file}: {e}")
+        log(f"❌ Error reading {env_file}: {e}")
         return False
 
 # ---------------------------------------------------------------------------
@@ -118,11 +432,10 @@ def check_environment_variables():
 def check_dependencies():
     print_header("3. Dependency Check")
     if not os.path.exists("package.json"):
-        print("❌ package.json not found")
+        log("❌ package.json not found")
         return False
     try:
-        with open("package.json", "r") as f:
-            pkg = json.load(f)
+        pkg = load_json_cached("package.json")
         deps = pkg.get("dependencies", {})
         dev_deps = pkg.get("devDependencies", {})
         critical_deps = [
@@ -133,17 +446,17 @@ def check_dependencies():
             "@google/generative-ai",
             "zustand"
         ]
-        print(f"Found {len(deps)} dependencies and {len(dev_deps)} devDependencies.")
+        log(f"Found {len(deps)} dependencies and {len(dev_deps)} devDependencies.")
         all_critical = True
         for dep in critical_deps:
             if dep in deps:
-                print(f"✅ {dep}: {deps[dep]}")
+                log(f"✅ {dep}: {deps[dep]}")
             else:
-                print(f"❌ Missing critical dependency: {dep}")
+                log(f"❌ Missing critical dependency: {dep}")
                 all_critical = False
         return all_critical
     except Exception as e:
-        print(f"❌ Error parsing package.json: {e}")
+        log(f"❌ Error parsing package.json: {e}")
         return False
 
 # ---------------------------------------------------------------------------
@@ -152,16 +465,16 @@ def check_dependencies():
 @time_step
 def run_linting():
     print_header("4. Code Quality & Linting")
-    success, stdout, stderr = run_command("npm run lint", ignore_error=True)
+    success, stdout, stderr = run_command("npm run lint", ignore_error=True, max_lines=None)
     if success:
-        print("✅ Linting passed with no errors")
+        log("✅ Linting passed with no errors")
     else:
-        print("⚠️ Linting issues detected (first 10 lines shown):")
+        log("⚠️ Linting issues detected (first 10 lines shown):")
         lines = (stdout + stderr).splitlines()
         for line in lines[:10]:
-            print(f"  {line}")
+            log(f"  {line}")
         if len(lines) > 10:
-            print(f"  ... and {len(lines)-10} more lines")
+            log(f"  ... and {len(lines)-10} more lines")
     return True  # Non‑blocking
 
 # ---------------------------------------------------------------------------
@@ -170,96 +483,161 @@ def run_linting():
 @time_step
 def run_static_analysis():
     print_header("5. Static Analysis (TypeScript)")
-    success, stdout, stderr = run_command("npx tsc --noEmit", ignore_error=True)
+    success, stdout, stderr = run_tsc()
     if success:
-        print("✅ TypeScript compilation successful")
+        log("✅ TypeScript compilation successful")
         return True
     else:
-        print("❌ TypeScript errors detected (first 5 shown):")
+        log("❌ TypeScript errors detected (first 5 shown):")
         lines = (stdout + stderr).splitlines()
         count = 0
         for line in lines:
             if "error TS" in line:
                 count += 1
                 if count <= 5:
-                    print(f"  {line.strip()}")
+                    log(f"  {line.strip()}")
         if count > 5:
-            print(f"  ... and {count-5} more errors")
+            log(f"  ... and {count-5} more errors")
         return False
 
 @time_step
 def run_type_check():
     print_header("5b. npm type-check")
-    success, stdout, stderr = run_command("npm run type-check", ignore_error=True)
+    try:
+        type_check_script = load_json_cached("package.json").get("scripts", {}).get("type-check", "")
+    except (OSError, ValueError):
+        type_check_script = ""
+    if is_plain_tsc(type_check_script):
+        log("⏭ type-check is plain `tsc --noEmit` – reusing static analysis result")
+        success, stdout, stderr = run_tsc()
+    else:
+        success, stdout, stderr = run_command("npm run type-check", ignore_error=True)
     if success:
-        print("✅ npm type-check succeeded")
+        log("✅ npm type-check succeeded")
         return True
     else:
-        print("❌ npm type-check failed")
-        print(stderr)
+        log("❌ npm type-check failed")
+        log(stderr)
         return False
 
 # ---------------------------------------------------------------------------
 # 6. Unit Tests & Coverage
 # ---------------------------------------------------------------------------
 @time_step
-def run_unit_tests():
-    print_header("6. Unit Tests")
-    success, stdout, stderr = run_command("npm test -- --passWithNoTests", ignore_error=True)
-    if success:
-        print("✅ Unit tests passed")
-        return True
-    else:
-        print("❌ Unit tests failed")
-        print(stderr)
-        return False
-
-@time_step
-def run_test_coverage():
-    print_header("6b. Test Coverage")
-    success, stdout, stderr = run_command("npm test -- --coverage", ignore_error=True)
+def run_tests_with_coverage():
+    print_header("6. Unit Tests & Coverage")
+    success, stdout, stderr = run_command(
+        "npm test -- --coverage --passWithNoTests --coverageReporters=text-summary",
+        ignore_error=True
+    )
     if success:
-        # Extract coverage summary lines
-        coverage_lines = []
-        capture = False
-        for line in stdout.splitlines():
-            if line.strip().startswith("----------"):
-                capture = not capture
-                continue
-            if capture:
-                coverage_lines.append(line)
-        print("✅ Coverage report (summary):")
-        for cl in coverage_lines[:10]:
-            print(f"  {cl}")
+        log("✅ Unit tests passed")
+        coverage_lines = COVERAGE_SUMMARY_RE.findall(stdout)
+        if coverage_lines:
+            log("✅ Coverage report (summary):")
+            for metric, value in coverage_lines:
+                log(f"  {metric.ljust(12)}: {value.strip()}")
+        else:
+            log("⚠️ No coverage summary found in output")
         return True
     else:
-        print("❌ Coverage generation failed")
-        print(stderr)
+        log("❌ Unit tests failed")
+        log(stderr)
         return False
 
 # ---------------------------------------------------------------------------
 # 7. Production Build
 # ---------------------------------------------------------------------------
+# Lives inside the build output so any other producer of that dir (e.g. a plain
+# `npm run build`) replaces it and invalidates the cache; Firebase skips dotfiles
+BUILD_HASH_FILE = ".build_hash"
+# Everything that can change the exported web bundle. expo export inlines
+# EXPO_PUBLIC_* values from the env files and resolves @/* through tsconfig.json
+BUILD_INPUTS = [
+    "src",
+    "assets",
+    "public",
+    "package.json",
+    "package-lock.json",
+    "app.json",
+    "tsconfig.json",
+    ".env",
+    ".env.local",
+    ".env.production",
+    ".env.production.local",
+    "babel.config.js",
+    "metro.config.js",
+    "webpack.config.js",
+    "scripts/metro-transformer.js",
+    "scripts/post-build.js",
+]
+
+def find_build_dir():
+    return "web-build" if os.path.isdir("web-build") else "dist" if os.path.isdir("dist") else None
+
+def iter_build_input_files():
+    """Every file under BUILD_INPUTS in a stable order, dotfiles included."""
+    for root in BUILD_INPUTS:
+        if os.path.isfile(root):
+            yield root
+            continue
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                yield os.path.join(dirpath, filename)
+
+def hash_build_inputs():
+    """Content hash of BUILD_INPUTS and the EXPO_PUBLIC_*/NODE_ENV environment; paths count so renames invalidate it."""
+    h = hashlib.blake2b(digest_size=16)
+    for path in iter_build_input_files():
+        h.update(path.replace(os.sep, "/").encode() + b"\0")
+        with open(path, "rb") as f:
+            h.update(f.read())
+    for name in sorted(os.environ):
+        if name.startswith("EXPO_PUBLIC_") or name == "NODE_ENV":
+            h.update(f"{name}={os.environ[name]}\0".encode())
+    return h.hexdigest()
+
 @time_step
 def run_production_build():
     print_header("7. Production Build Verification")
+    try:
+        build_hash = hash_build_inputs()
+    except OSError as e:
+        # e.g. a file vanished mid-walk; just build without the cache
+        log(f"⚠️ Could not hash build inputs ({e}) – building without cache")
+        build_hash = None
+    build_dir = find_build_dir()
+    cached_hash = None
+    if build_dir:
+        with contextlib.suppress(OSError), open(os.path.join(build_dir, BUILD_HASH_FILE), "r") as f:
+            cached_hash = f.read().strip()
+    if build_hash and cached_hash == build_hash:
+        log(f"🥶 build cache hit – inputs unchanged since last successful build, reusing {build_dir}")
+        return True
+    # Drop any stale hash first so an interrupted build never looks like a hit
+    for out_dir in ("web-build", "dist"):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(os.path.join(out_dir, BUILD_HASH_FILE))
     start = time.time()
     success, stdout, stderr = run_command("npm run build:production")
     duration = time.time() - start
-    print(f"⏱ Build duration: {duration:.2f}s")
+    log(f"⏱ Build duration: {duration:.2f}s")
     if success:
-        print("✅ Production build succeeded")
-        if os.path.isdir("web-build"):
-            print("✅ web-build directory exists")
-        elif os.path.isdir("dist"):
-            print("✅ dist directory exists")
+        log("✅ Production build succeeded")
+        build_dir = find_build_dir()
+        if build_dir:
+            log(f"✅ {build_dir} directory exists")
+            if build_hash:
+                with open(os.path.join(build_dir, BUILD_HASH_FILE), "w") as f:
+                    f.write(build_hash)
         else:
-            print("⚠️ No expected build output directory found")
+            log("⚠️ No expected build output directory found")
         return True
     else:
-        print("❌ Production build failed (last 20 lines):")
+        log("❌ Production build failed (last 20 lines):")
         for line in stderr.splitlines()[-20:]:
-            print(f"  {line}")
+            log(f"  {line}")
         return False
 
 # ---------------------------------------------------------------------------
@@ -269,18 +647,17 @@ def run_production_build():
 def check_firebase_config():
     print_header("8. Firebase Configuration Check")
     if not os.path.exists("firebase.json"):
-        print("❌ firebase.json not found")
+        log("❌ firebase.json not found")
         return False
     try:
-        with open("firebase.json", "r") as f:
-            cfg = json.load(f)
+        cfg = load_json_cached("firebase.json")
         if "hosting" in cfg:
-            print("✅ hosting config present")
+            log("✅ hosting config present")
         else:
-            print("⚠️ hosting config missing")
+            log("⚠️ hosting config missing")
         return True
     except Exception as e:
-        print(f"❌ Error parsing firebase.json: {e}")
+        log(f"❌ Error parsing firebase.json: {e}")
         return False
 
 # ---------------------------------------------------------------------------
@@ -290,19 +667,18 @@ def check_firebase_config():
 def check_expo_config():
     print_header("9. Expo Configuration Check")
     if not os.path.exists("app.json"):
-        print("❌ app.json not found")
+        log("❌ app.json not found")
         return False
     try:
-        with open("app.json", "r") as f:
-            cfg = json.load(f)
+        cfg = load_json_cached("app.json")
         expo = cfg.get("expo", {})
         if expo.get("name") and expo.get("slug"):
-            print("✅ Expo name and slug defined")
+            log("✅ Expo name and slug defined")
         else:
-            print("⚠️ Expo name or slug missing")
+            log("⚠️ Expo name or slug missing")
         return True
     except Exception as e:
-        print(f"❌ Error parsing app.json: {e}")
+        log(f"❌ Error parsing app.json: {e}")
         return False
 
 # ---------------------------------------------------------------------------
@@ -311,16 +687,17 @@ def check_expo_config():
 @time_step
 def verify_build_artifacts():
     print_header("10. Build Artifact Verification")
-    build_dir = "web-build" if os.path.isdir("web-build") else "dist" if os.path.isdir("dist") else None
+    build_dir = find_build_dir()
     if not build_dir:
-        print("❌ No build directory found")
+        log("❌ No build directory found")
         return False
     expected = ["index.html", "manifest.json", "static"]
-    missing = [e for e in expected if not os.path.exists(os.path.join(build_dir, e))]
+    existing = list_dir_entries(build_dir)
+    missing = [e for e in expected if e not in existing]
     if missing:
-        print(f"⚠️ Missing artifacts: {', '.join(missing)}")
+        log(f"⚠️ Missing artifacts: {', '.join(missing)}")
         return False
-    print("✅ All key artifacts present")
+    log("✅ All key artifacts present")
     return True
 
 # ---------------------------------------------------------------------------
@@ -337,14 +714,14 @@ def check_api_endpoints():
     all_ok = True
     for url in endpoints:
         try:
-            with urllib.request.urlopen(url, timeout=5) as resp:
-                if resp.status == 200:
-                    print(f"✅ {url} responded 200")
-                else:
-                    print(f"⚠️ {url} responded {resp.status}")
-                    all_ok = False
+            status, _ = http_get(url)
+            if status == 200:
+                log(f"✅ {url} responded 200")
+            else:
+                log(f"⚠️ {url} responded {status}")
+                all_ok = False
         except Exception as e:
-            print(f"❌ {url} request failed: {e}")
+            log(f"❌ {url} request failed: {e}")
             all_ok = False
     return all_ok
 
@@ -355,141 +732,219 @@ def check_api_endpoints():
 def test_web_server():
     print_header("12. Web Server Runtime Test")
     if check_port(8081):
-        print("⚠️ Port 8081 in use – attempting to free")
-        subprocess.call(['taskkill', '/F', '/IM', 'node.exe'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        time.sleep(2)
-    server_process = subprocess.Popen(
-        ["npm", "run", "start-web"],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        shell=True,
-        cwd=os.getcwd()
-    )
-    try:
-        max_wait = 45
-        for i in range(max_wait):
-            if check_port(8081):
-                print("✅ Server listening on 8081")
-                break
-            time.sleep(1)
-            if i % 5 == 0:
-                print(f"Waiting for server... ({i}/{max_wait})")
-        else:
-            print("❌ Server failed to start within timeout")
-            return False
-        # Basic HTTP checks
-        urls = [
-            f"http://localhost:8081/",
-            f"http://localhost:8081/manifest.json"
-        ]
-        for u in urls:
-            try:
-                with urllib.request.urlopen(u) as resp:
-                    if resp.status == 200:
-                        print(f"✅ {u} returned 200")
-                    else:
-                        print(f"⚠️ {u} returned {resp.status}")
-            except Exception as e:
-                print(f"❌ Request to {u} failed: {e}")
-        # Simple DOM sanity check (look for root div)
+        log("❌ Port 8081 already in use – stop the running server first")
+        return False
+    with spawn_server(["npm", "run", "start-web"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL):
         try:
-            with urllib.request.urlopen("http://localhost:8081/") as resp:
-                content = resp.read().decode('utf-8')
+            if wait_for_port(8081, timeout=45):
+                log("✅ Server listening on 8081")
+            else:
+                log("❌ Server failed to start within timeout")
+                return False
+            # Basic HTTP checks
+            urls = [
+                f"http://localhost:8081/",
+                f"http://localhost:8081/manifest.json"
+            ]
+            for u in urls:
+                try:
+                    status, _ = http_get(u)
+                    if status == 200:
+                        log(f"✅ {u} returned 200")
+                    else:
+                        log(f"⚠️ {u} returned {status}")
+                except Exception as e:
+                    log(f"❌ Request to {u} failed: {e}")
+            # Simple DOM sanity check (look for root div)
+            try:
+                _, body = http_get("http://localhost:8081/")
+                content = body.decode('utf-8')
                 if "<div id=\"root\"" in content:
-                    print("✅ Root div present in HTML")
+                    log("✅ Root div present in HTML")
                 else:
-                    print("⚠️ Root div missing in HTML")
-        except Exception as e:
-            print(f"❌ HTML fetch failed: {e}")
-    finally:
-        print("\nStopping web server...")
-        subprocess.call(['taskkill', '/F', '/T', '/PID', str(server_process.pid)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                    log("⚠️ Root div missing in HTML")
+            except Exception as e:
+                log(f"❌ HTML fetch failed: {e}")
+        finally:
+            log("\nStopping web server...")
+            close_http_connections()
     return True
 
 # ---------------------------------------------------------------------------
 # 13. Expo Development Server Check (optional)
 # ---------------------------------------------------------------------------
+def start_web_covers_start():
+    """True if `npm run start-web` boots the same Metro server as `npm run start`, plus --web."""
+    try:
+        scripts = load_json_cached("package.json").get("scripts", {})
+    except (OSError, ValueError):
+        return False
+    return "expo start" in scripts.get("start", "") and "expo start --web" in scripts.get("start-web", "")
+
+EXPO_READY_RE = re.compile(rb"QR Code|Metro waiting")
+
 @time_step
 def run_expo_dev_server():
     print_header("13. Expo Development Server Check")
     # This will start the Expo dev server; we only verify it starts and provides a QR code line.
-    dev_process = subprocess.Popen(
-        ["npm", "run", "start"],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE,
-        shell=True,
-        cwd=os.getcwd()
-    )
-    try:
-        for i in range(30):
-            line = dev_process.stdout.readline().decode('utf-8').strip()
-            if line:
-                print(f"[expo] {line}")
-            if "QR Code" in line or "Metro waiting" in line:
-                print("✅ Expo dev server appears healthy")
+    with spawn_server(["npm", "run", "start"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT) as dev_process:
+        healthy = False
+        pending = b""
+        for chunk in iter_output_chunks(dev_process.stdout, deadline=time.monotonic() + 30):
+            data = pending + chunk
+            *lines, pending = data.split(b"\n")
+            for line in lines:
+                text = line.decode('utf-8', 'replace').strip()
+                if text:
+                    log(f"[expo] {text}")
+            if EXPO_READY_RE.search(data):
+                healthy = True
                 break
-            time.sleep(1)
+        if healthy:
+            log("✅ Expo dev server appears healthy")
         else:
-            print("⚠️ Expo dev server did not emit expected startup messages")
-    finally:
-        subprocess.call(['taskkill', '/F', '/T', '/PID', str(dev_process.pid)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            log("⚠️ Expo dev server did not emit expected startup messages")
     return True
 
 # ---------------------------------------------------------------------------
 # Main orchestration
 # ---------------------------------------------------------------------------
-def main():
+# (name, function, dependencies) in a valid topological order, cheap checks first
+PHASES = [
+    ("file_structure", check_file_structure, []),
+    ("env_vars", check_environment_variables, []),
+    ("dependencies", check_dependencies, []),
+    ("firebase_config", check_firebase_config, []),
+    ("expo_config", check_expo_config, []),
+    ("linting", run_linting, []),
+    ("static_analysis", run_static_analysis, []),
+    ("type_check", run_type_check, []),
+    ("unit_tests", run_tests_with_coverage, []),
+    ("build", run_production_build, []),
+    ("build_artifacts", verify_build_artifacts, ["build"]),
+    ("api_endpoints", check_api_endpoints, []),
+    ("web_server", test_web_server, ["build"]),
+    ("expo_dev", run_expo_dev_server, []),
+]
+# Phases that probe or bind port 8081 run one at a time on the main thread
+SERIAL_PHASES = {"api_endpoints", "web_server", "expo_dev"}
+# With --fail-fast only this many independent phases run at once, so a failing
+# cheap check stops the expensive ones queued behind it from ever starting
+FAIL_FAST_WORKERS = 2
+
+def select_phases(only=None, skip=None):
+    """Phase names to run, in PHASES order: `only` (default all) plus their dependencies, minus `skip` and its dependents."""
+    deps_of = {name: deps for name, _, deps in PHASES}
+    wanted = set(only) if only else set(deps_of)
+    pending = list(wanted)
+    while pending:
+        for dep in deps_of[pending.pop()]:
+            if dep not in wanted:
+                wanted.add(dep)
+                pending.append(dep)
+    wanted -= skip or set()
+    # Drop anything whose dependencies were skipped; PHASES order makes one pass enough
+    selected = []
+    for name, _, deps in PHASES:
+        if name in wanted and all(dep in selected for dep in deps):
+            selected.append(name)
+    return selected
+
+def parse_args(argv=None):
+    phase_names = [name for name, _, _ in PHASES]
+
+    def phase_set(value):
+        names = {n.strip() for n in value.split(",") if n.strip()}
+        unknown = names - set(phase_names)
+        if unknown:
+            raise argparse.ArgumentTypeError(f"unknown phase(s): {', '.join(sorted(unknown))}")
+        return names
+
+    parser = argparse.ArgumentParser(description="Chronicle Weaver extended test suite")
+    parser.add_argument("--only", type=phase_set,
+                        help=f"comma-separated phases to run, plus their dependencies ({', '.join(phase_names)})")
+    parser.add_argument("--skip", type=phase_set, default=set(),
+                        help="comma-separated phases to skip; phases depending on them are skipped too")
+    parser.add_argument("--fail-fast", action="store_true",
+                        help=f"don't start any further phases after the first failure; phases already running "
+                             f"finish, and independent phases run at most {FAIL_FAST_WORKERS} at a time")
+    parser.add_argument("--timings-json", metavar="PATH",
+                        help="also write per-step timings to PATH as JSON")
+    args = parser.parse_args(argv)
+    args.phases = select_phases(args.only, args.skip)
+    dropped = sorted((args.only or set()) - args.skip - set(args.phases))
+    if dropped:
+        parser.error(f"--only phase(s) {', '.join(dropped)} depend on a phase excluded by --skip")
+    if not args.phases:
+        parser.error("no phases selected to run")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
     print_header("CHRONICLE WEAVER - EXTENDED COMPREHENSIVE TEST SUITE")
-    print(f"Timestamp: {time.strftime('%Y-%m-%d %H:%M:%S')}")
-    results = {
-        "file_structure": False,
-        "env_vars": False,
-        "dependencies": False,
-        "linting": False,
-        "static_analysis": False,
-        "type_check": False,
-        "unit_tests": False,
-        "coverage": False,
-        "build": False,
-        "firebase_config": False,
-        "expo_config": False,
-        "build_artifacts": False,
-        "api_endpoints": False,
-        "web_server": False,
-        "expo_dev": False,
-    }
-    results["file_structure"] = check_file_structure()
-    results["env_vars"] = check_environment_variables()
-    results["dependencies"] = check_dependencies()
-    results["linting"] = run_linting()
-    results["static_analysis"] = run_static_analysis()
-    results["type_check"] = run_type_check()
-    results["unit_tests"] = run_unit_tests()
-    results["coverage"] = run_test_coverage()
-    results["build"] = run_production_build()
-    results["firebase_config"] = check_firebase_config()
-    results["expo_config"] = check_expo_config()
-    results["build_artifacts"] = verify_build_artifacts()
-    results["api_endpoints"] = check_api_endpoints()
-    if results["build"]:
-        results["web_server"] = test_web_server()
-    else:
-        print_header("Skipping Web Server Test – build failed")
-    # Optional dev server check – non‑blocking, can be disabled if too noisy
-    results["expo_dev"] = run_expo_dev_server()
+    log(f"Timestamp: {time.strftime('%Y-%m-%d %H:%M:%S')}")
+    selected = args.phases
+    funcs = {name: func for name, func, _ in PHASES}
+    deps_of = {name: deps for name, _, deps in PHASES}
+    aborted = threading.Event()
+
+    def run_phase(name, buffered):
+        # None marks a phase that never started because --fail-fast tripped
+        if aborted.is_set():
+            return None
+        # Pool phases log as whole blocks; serial ones own the console and stream live
+        with buffered_log() if buffered else contextlib.nullcontext():
+            try:
+                ok = funcs[name]()
+            except Exception:
+                # A crashing phase is a failed phase; keep going so the summary still prints
+                log(f"❌ {name} raised an unexpected error:\n{traceback.format_exc()}")
+                ok = False
+        if not ok and args.fail_fast and name != "linting":
+            aborted.set()
+        return ok
+
+    # Independent phases are filesystem reads or node/npm subprocesses, so threads overlap them
+    serial = [name for name in selected if deps_of[name] or name in SERIAL_PHASES]
+    parallel = [name for name in selected if name not in serial]
+    results = {}
+    workers = min(len(parallel), FAIL_FAST_WORKERS) if args.fail_fast else len(parallel)
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+        futures = {name: pool.submit(run_phase, name, True) for name in parallel}
+        for name in serial:
+            for dep in deps_of[name]:
+                if dep in futures:
+                    results[dep] = futures[dep].result()
+            failed_deps = [dep for dep in deps_of[name] if not results.get(dep)]
+            if aborted.is_set():
+                results[name] = None
+            elif failed_deps:
+                print_header(f"Skipping {name} – {', '.join(failed_deps)} did not pass")
+                results[name] = False
+            elif name == "expo_dev" and results.get("build") and "web_server" in results and start_web_covers_start():
+                log("⏭ expo_dev skipped: covered by web_server")
+                results[name] = results["web_server"]
+            else:
+                results[name] = run_phase(name, False)
+        for name in parallel:
+            results[name] = futures[name].result()
     # Summary
     print_header("TEST SUMMARY")
     all_passed = True
-    for name, ok in results.items():
-        status = "✅ PASS" if ok else "❌ FAIL"
+    for name in selected:
+        ok = results[name]
+        status = "⏭ SKIP" if ok is None else "✅ PASS" if ok else "❌ FAIL"
         if not ok and name != "linting":
             all_passed = False
-        print(f"{name.ljust(20)}: {status}")
+        log(f"{name.ljust(20)}: {status}")
+    print_timings()
+    if args.timings_json:
+        write_timings_json(args.timings_json)
     if all_passed:
-        print("\n🎉 ALL CHECKS PASSED – ready for deployment!")
+        log("\n🎉 ALL CHECKS PASSED – ready for deployment!")
         sys.exit(0)
     else:
-        print("\n⚠️ SOME CHECKS FAILED – review above details.")
+        log("\n⚠️ SOME CHECKS FAILED – review above details.")
         sys.exit(1)
 
 if __name__ == "__main__":